@@ -1,193 +1,972 @@
 import gradio as gr
+import aiofiles
+import asyncio
+import functools
+import hashlib
+import io
 import os
+import re
+import time
+import uuid
+import wave
+from collections import OrderedDict
 from pathlib import Path
+import httpx
 import soundfile as sf
 import numpy as np
+from scipy.signal import oaconvolve, resample_poly
 from elevenlabs import VoiceSettings
-from elevenlabs.client import ElevenLabs
+from elevenlabs.client import AsyncElevenLabs
 
 # Create voices directory if it doesn't exist
 VOICES_DIR = Path("voices")
 VOICES_DIR.mkdir(exist_ok=True)
 
-# Global variable to store the saved voice path
-saved_voice_path = None
+# Voice cloning gains nothing from higher sample rates, so recordings are
+# stored as 16 kHz mono to keep the upload small
+VOICE_SAMPLE_RATE = 16000
 
+# Silence trimming: RMS window (in samples) and threshold relative to the
+# loudest window, plus the peak level recordings are normalized to
+SILENCE_WINDOW = 512
+SILENCE_THRESHOLD = 0.02
+NORMALIZE_PEAK = 0.95
 
-def save_voice(audio_tuple):
+# Create the generated speech cache directory if it doesn't exist
+CACHE_DIR = Path("cache/tts")
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+TTS_CACHE_MAX_BYTES = 500 * 1024 * 1024
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# Part files older than this were left by a killed process or an abandoned
+# stream, and are removed when the cache is pruned
+PART_FILE_MAX_AGE = 60 * 60
+
+# Multi-sentence text is split on sentence ends and blank lines so each
+# sentence can be generated (and cached) independently
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+# Limit concurrent ElevenLabs requests across all sessions; the free tier
+# only allows 2 at a time, so extra requests wait here instead of failing
+ELEVEN_CONCURRENCY = int(os.getenv("ELEVEN_CONCURRENCY", "2"))
+_eleven_semaphore = None
+
+# Gradio queue: events processed in parallel when they don't set their own
+# limit (Save Voice), and requests allowed to wait in the queue
+UI_CONCURRENCY = int(os.getenv("UI_CONCURRENCY", "4"))
+UI_QUEUE_SIZE = 32
+
+# HTTP settings for the shared ElevenLabs clients. Clients for the most
+# recently used keys are kept; an evicted client's connection pool is closed
+# after a grace period so requests still using it can finish.
+HTTP_TIMEOUT = 60
+HTTP_RETRIES = 2
+CLIENT_CACHE_SIZE = 4
+CLIENT_CLOSE_DELAY = 5 * 60
+_clients = OrderedDict()
+
+# Cache of cloned ElevenLabs voices, keyed by (audio hash, API key fingerprint)
+# so an unchanged recording is only uploaded once per account. Each entry keeps
+# the API key so evicted voices can always be deleted, and a per-entry lock
+# stops concurrent misses from cloning the same recording twice. Voices still
+# used by an in-flight request are counted and never evicted.
+VOICE_CACHE_SIZE = 8
+VOICE_HASH_LENGTH = 16
+_voice_cache = OrderedDict()
+_voice_locks = {}
+_voice_users = {}
+# Ids of evicted voices whose background delete hasn't finished yet
+_deleting_voices = set()
+
+# Cloned voices are named "<strategy name> [<audio hash>]", so voices left on
+# the account by an earlier run can be found again and reused or cleaned up
+VOICE_NAME_RE = re.compile(r"^(\w+) \[([0-9a-f]{%d})\]$" % VOICE_HASH_LENGTH)
+
+# Fire-and-forget cleanup tasks, referenced here so they aren't garbage
+# collected before they finish
+_background_tasks = set()
+
+
+# API error classification: keywords found in ElevenLabs error messages, and
+# the message shown for each, checked in priority order
+_ERR_RE = re.compile(
+    r"invalid_api_key|unauthorized|401|voice_limit_reached|quota|limit|subscription|plan|403",
+    re.IGNORECASE
+)
+
+_INVALID_KEY_MSG = "❌ Invalid API key. Please check your ElevenLabs API key."
+_VOICE_LIMIT_MSG = "❌ Your ElevenLabs account has no free custom voice slots. Delete unused voices in the dashboard and try again."
+_QUOTA_MSG = "❌ API quota exceeded. Please check your ElevenLabs account."
+_STARTER_PLAN_MSG = "❌ Instant Voice Cloning via API requires a 'Starter' plan or higher. Free users can only use character-based voices in the Dashboard."
+_PAID_PLAN_MSG = "❌ Voice cloning requires a paid ElevenLabs plan. Try the basic method instead."
+
+BASIC_ERRORS = {
+    "invalid_api_key": _INVALID_KEY_MSG,
+    "unauthorized": _INVALID_KEY_MSG,
+    "401": _INVALID_KEY_MSG,
+    "voice_limit_reached": _VOICE_LIMIT_MSG,
+    "quota": _QUOTA_MSG,
+    "limit": _QUOTA_MSG,
+    "subscription": _STARTER_PLAN_MSG,
+    "plan": _STARTER_PLAN_MSG,
+    "403": _STARTER_PLAN_MSG,
+}
+
+PRO_ERRORS = {
+    "invalid_api_key": _INVALID_KEY_MSG,
+    "unauthorized": _INVALID_KEY_MSG,
+    "401": _INVALID_KEY_MSG,
+    "voice_limit_reached": _VOICE_LIMIT_MSG,
+    "quota": _PAID_PLAN_MSG,
+    "subscription": _PAID_PLAN_MSG,
+    "plan": _PAID_PLAN_MSG,
+}
+
+
+# Generation methods offered in the UI. "basic" uses Instant Voice Cloning
+# with tuned voice settings; "pro" uses the model defaults and requires a paid
+# plan. Both share the rest of clone_and_speak.
+STRATEGIES = {
+    "basic": {
+        "name": "TempClonedVoice",
+        "description": "Voice created from Gradio recording",
+        "settings": VoiceSettings(
+            stability=0.5,
+            similarity_boost=0.75,
+            style=0.0,
+            use_speaker_boost=True
+        ),
+        "model_id": "eleven_multilingual_v2",
+        "errors": BASIC_ERRORS,
+        "error_prefix": "❌ Error generating speech",
+        "success": "✅ Speech generated using YOUR voice! Listen below.",
+    },
+    "pro": {
+        "name": "MyClonedVoice",
+        "description": None,
+        "settings": None,
+        "model_id": "eleven_multilingual_v2",
+        "errors": PRO_ERRORS,
+        "error_prefix": "❌ Error with voice cloning",
+        "success": "✅ Speech generated with voice cloning! Listen below.",
+    },
+}
+
+
+def eleven_semaphore():
     """
-    Save the recorded audio to the voices directory.
+    Return the semaphore limiting concurrent ElevenLabs requests.
+    
+    It is created on first use so it belongs to the event loop Gradio serves
+    from; on Python 3.9 a semaphore created at import binds to the importing
+    thread's loop instead.
+    
+    Returns:
+        asyncio.Semaphore: The shared semaphore
+    """
+    global _eleven_semaphore
+    if _eleven_semaphore is None:
+        _eleven_semaphore = asyncio.Semaphore(ELEVEN_CONCURRENCY)
+    return _eleven_semaphore
+
+
+def _classify_error(e, messages, fallback):
+    """
+    Map an ElevenLabs exception to a user-facing status message.
     
     Args:
-        audio_tuple: Tuple of (sample_rate, audio_data) from Gradio microphone
+        e: The exception raised by the API call
+        messages: Dict of error keyword to message, in priority order
+        fallback: Prefix for errors that match no keyword
     
     Returns:
         str: Status message
     """
-    global saved_voice_path
+    error_msg = str(e)
+    found = {m.lower() for m in _ERR_RE.findall(error_msg)}
+    for keyword, message in messages.items():
+        if keyword in found:
+            return message
+    return f"{fallback}: {error_msg}"
+
+
+def get_client(api_key):
+    """
+    Return a shared AsyncElevenLabs client for an API key.
     
-    if audio_tuple is None:
-        return "❌ No audio recorded. Please record your voice first."
+    Reusing the client keeps its HTTP/2 connection to api.elevenlabs.io warm,
+    so only the first request per key pays for the TCP and TLS handshake.
+    Transient connection failures are retried by the transport. At most
+    CLIENT_CACHE_SIZE clients are kept; older ones are closed in the
+    background.
     
-    try:
-        sample_rate, audio_data = audio_tuple
+    Args:
+        api_key: ElevenLabs API key
+    
+    Returns:
+        AsyncElevenLabs: The client
+    """
+    if api_key in _clients:
+        _clients.move_to_end(api_key)
+        return _clients[api_key][0]
+    
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=HTTP_RETRIES,
+        limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60)
+    )
+    http_client = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+    client = AsyncElevenLabs(
+        api_key=api_key,
+        timeout=HTTP_TIMEOUT,
+        httpx_client=http_client
+    )
+    _clients[api_key] = (client, http_client)
+    
+    while len(_clients) > CLIENT_CACHE_SIZE:
+        _, (_, old_http_client) = _clients.popitem(last=False)
+        run_in_background(_close_later(old_http_client))
+    
+    return client
+
+
+async def _close_later(http_client):
+    """Close an evicted HTTP client once in-flight requests have had time to finish."""
+    await asyncio.sleep(CLIENT_CLOSE_DELAY)
+    await http_client.aclose()
+
+
+def run_in_background(coro):
+    """
+    Schedule a coroutine without waiting for it, ignoring any errors.
+    
+    Args:
+        coro: Coroutine to run
+    
+    Returns:
+        asyncio.Task: The scheduled task
+    """
+    async def quietly():
+        try:
+            await coro
+        except Exception:
+            pass
+    
+    task = asyncio.create_task(quietly())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _key_fingerprint(api_key):
+    """Return a short, non-reversible fingerprint of an API key."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+async def delete_voice(client, voice_id):
+    """
+    Delete a cloned voice from the account, within the ElevenLabs request limit.
+    
+    Args:
+        client: AsyncElevenLabs client
+        voice_id: ElevenLabs voice id
+    """
+    async with eleven_semaphore():
+        await client.voices.delete(voice_id)
+
+
+def delete_voice_later(client, voice_id):
+    """
+    Delete a cloned voice in the background.
+    
+    Until the delete finishes the voice is still listed on the account, so
+    _find_cloned_voice is told to skip it rather than adopt it again.
+    
+    Args:
+        client: AsyncElevenLabs client
+        voice_id: ElevenLabs voice id
+    """
+    async def delete():
+        try:
+            await delete_voice(client, voice_id)
+        finally:
+            _deleting_voices.discard(voice_id)
+    
+    _deleting_voices.add(voice_id)
+    run_in_background(delete())
+
+
+def _voice_key(voice_hash, api_key):
+    """Return the voice cache key for a recording and API key."""
+    return (voice_hash[:VOICE_HASH_LENGTH], _key_fingerprint(api_key))
+
+
+def _evict_cloned_voices():
+    """
+    Delete the least recently used cloned voices beyond VOICE_CACHE_SIZE.
+    
+    Voices still in use are skipped, so the cache can briefly exceed its size;
+    release_cloned_voice evicts them once their last request finishes.
+    """
+    for key in list(_voice_cache):
+        if len(_voice_cache) <= VOICE_CACHE_SIZE:
+            break
+        if _voice_users.get(key):
+            continue
+        voice_id, api_key = _voice_cache.pop(key)
+        _voice_locks.pop(key, None)
+        # The delete runs in the background so it doesn't delay generation
+        delete_voice_later(get_client(api_key), voice_id)
+
+
+async def _find_cloned_voice(client, api_key, voice_key):
+    """
+    Look for a voice this app cloned earlier on the account.
+    
+    Voices left behind by a previous run are adopted into the voice cache as
+    least recently used, so they are reused or deleted like any other entry.
+    
+    Args:
+        client: AsyncElevenLabs client
+        api_key: ElevenLabs API key the client was created with
+        voice_key: (audio hash, API key fingerprint) being looked up
+    
+    Returns:
+        str: The matching voice id, or None
+    """
+    strategy_names = {cfg["name"] for cfg in STRATEGIES.values()}
+    fingerprint = voice_key[1]
+    found = None
+    
+    response = await client.voices.get_all()
+    for voice in response.voices:
+        if voice.voice_id in _deleting_voices:
+            continue
+        match = VOICE_NAME_RE.match(voice.name or "")
+        if not match or match.group(1) not in strategy_names:
+            continue
+        key = (match.group(2), fingerprint)
+        if key == voice_key:
+            if found is None:
+                found = voice.voice_id
+                continue
+        elif key not in _voice_cache:
+            _voice_cache[key] = (voice.voice_id, api_key)
+            _voice_cache.move_to_end(key, last=False)
+            continue
+        elif _voice_cache[key][0] == voice.voice_id:
+            continue
         
-        # Generate filename
-        voice_filename = VOICES_DIR / "my_voice.wav"
+        # Duplicate clone of a recording that already has a voice
+        delete_voice_later(client, voice.voice_id)
+    
+    return found
+
+
+async def get_cloned_voice(client, api_key, voice_data, voice_hash,
+                           name, description=None):
+    """
+    Return the ElevenLabs voice id for a recording, cloning it only if needed.
+    
+    The recording is keyed by its content hash, so repeated generations with
+    the same saved voice reuse the voice created on the first call, including
+    one created by an earlier run of the app. The oldest cached voices are
+    deleted from the account in the background once more than
+    VOICE_CACHE_SIZE exist.
+    
+    The voice is marked as in use until release_cloned_voice is called, so it
+    can't be evicted while the caller is still generating with it.
+    
+    Args:
+        client: AsyncElevenLabs client
+        api_key: ElevenLabs API key the client was created with
+        voice_data: Contents of the saved voice recording
+        voice_hash: SHA-256 hex digest of voice_data
+        name: Name to give the voice on ElevenLabs
+        description: Optional voice description
+    
+    Returns:
+        str: The ElevenLabs voice id
+    """
+    key = _voice_key(voice_hash, api_key)
+    
+    async with _voice_locks.setdefault(key, asyncio.Lock()):
+        if key in _voice_cache:
+            _voice_cache.move_to_end(key)
+            _voice_users[key] = _voice_users.get(key, 0) + 1
+            return _voice_cache[key][0]
         
-        # Save audio file
-        sf.write(str(voice_filename), audio_data, sample_rate)
-        saved_voice_path = str(voice_filename)
+        try:
+            async with eleven_semaphore():
+                voice_id = await _find_cloned_voice(client, api_key, key)
+                
+                if voice_id is None:
+                    # This requires the "Starter" plan or higher on ElevenLabs for API usage
+                    upload = io.BytesIO(voice_data)
+                    # The SDK uses .name as the filename of the multipart upload
+                    upload.name = "voice.wav"
+                    kwargs = {"name": f"{name} [{key[0]}]", "files": [upload]}
+                    if description:
+                        kwargs["description"] = description
+                    voice = await client.voices.add(**kwargs)
+                    voice_id = voice.voice_id
+        except BaseException:
+            # Nothing was cached, so the lock would never be evicted
+            _voice_locks.pop(key, None)
+            raise
         
-        return f"✅ Voice saved successfully to {voice_filename}!"
+        _voice_cache[key] = (voice_id, api_key)
+        _voice_cache.move_to_end(key)
+        _voice_users[key] = _voice_users.get(key, 0) + 1
+        _evict_cloned_voices()
     
-    except Exception as e:
-        return f"❌ Error saving voice: {str(e)}"
+    return voice_id
 
 
-def clone_and_speak(text, api_key):
+def release_cloned_voice(voice_hash, api_key):
     """
-    Clone the saved voice and generate speech from text using ElevenLabs API.
+    Mark one use of a voice from get_cloned_voice as finished.
+    
+    Args:
+        voice_hash: SHA-256 hex digest of the saved voice recording
+        api_key: ElevenLabs API key the voice belongs to
+    """
+    key = _voice_key(voice_hash, api_key)
+    users = _voice_users.get(key, 0) - 1
+    if users > 0:
+        _voice_users[key] = users
+    else:
+        _voice_users.pop(key, None)
+        # Catch up on eviction that was deferred while the voice was in use
+        _evict_cloned_voices()
+
+
+def forget_cloned_voice(voice_hash, api_key):
+    """
+    Drop a recording's voice from the cache, e.g. after it was deleted remotely.
+    
+    Args:
+        voice_hash: SHA-256 hex digest of the saved voice recording
+        api_key: ElevenLabs API key the voice belongs to
+    """
+    key = _voice_key(voice_hash, api_key)
+    _voice_cache.pop(key, None)
+    _voice_locks.pop(key, None)
+
+
+def tts_cache_path(text, voice_hash, model_id, voice_settings=None):
+    """
+    Return the cache file for a generated speech request.
     
     Args:
         text: The text to convert to speech
-        api_key: ElevenLabs API key
+        voice_hash: SHA-256 hex digest of the saved voice recording
+        model_id: ElevenLabs model id
+        voice_settings: Optional VoiceSettings used for generation
     
     Returns:
-        tuple: (audio_path, status_message)
+        Path: Location of the cached MP3 (which may not exist yet)
+    """
+    if voice_settings is None:
+        settings = "default"
+    else:
+        settings = "|".join(str(v) for v in (
+            voice_settings.stability,
+            voice_settings.similarity_boost,
+            voice_settings.style,
+            int(bool(voice_settings.use_speaker_boost)),
+        ))
+    key = hashlib.sha256(
+        f"{text}|{voice_hash}|{model_id}|{settings}".encode()
+    ).hexdigest()
+    return CACHE_DIR / f"{key}.mp3"
+
+
+def use_cached(path):
     """
-    global saved_voice_path
+    Mark a cache entry as recently used, reporting whether it can be served.
     
-    # Validation
-    if not text or text.strip() == "":
-        return None, "❌ Please enter some text to generate speech."
+    The entry may be pruned by another thread at any time, so a missing file
+    (or an empty one) is treated as a cache miss rather than recreated.
     
-    if not api_key or api_key.strip() == "":
-        return None, "❌ Please enter your ElevenLabs API key."
+    Args:
+        path: Cache file returned by tts_cache_path
     
-    if saved_voice_path is None or not os.path.exists(saved_voice_path):
-        return None, "❌ No voice saved. Please record and save your voice first."
+    Returns:
+        bool: True if the cached MP3 exists and is non-empty
+    """
+    try:
+        os.utime(path)
+        return os.stat(path).st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def split_sentences(text):
+    """
+    Split text into sentences for independent generation.
+    
+    Args:
+        text: The text to convert to speech
     
+    Returns:
+        list: Non-empty, stripped sentences
+    """
+    return [s.strip() for s in SENTENCE_RE.split(text.strip()) if s.strip()]
+
+
+async def stream_tts_to_cache(output_path, audio_chunks):
+    """
+    Write streamed audio chunks to the cache, passing each one through.
+    
+    The audio is written to a temporary file first so that a failed or
+    concurrent generation never leaves a truncated MP3 behind. A stream with
+    no audio is never published, since it would be served from cache forever.
+    
+    Args:
+        output_path: Cache file returned by tts_cache_path
+        audio_chunks: Async iterator of MP3 byte chunks
+    
+    Yields:
+        bytes: Each non-empty chunk, as soon as it has been buffered
+    """
+    part_path = output_path.with_name(f"{output_path.stem}.{uuid.uuid4().hex}.part")
     try:
-        # Initialize ElevenLabs client
-        client = ElevenLabs(api_key=api_key.strip())
-        
-        # Step 1: Create a temporary voice clone from the recording
-        # This requires the "Starter" plan or higher on ElevenLabs for API usage
-        with open(saved_voice_path, 'rb') as f:
-            voice = client.voices.add(
-                name="TempClonedVoice",
-                description="Temporary voice created from Gradio recording",
-                files=[f]
-            )
-        
-        voice_id = voice.voice_id
-        
-        # Step 2: Generate speech using the newly created voice
-        audio_generator = client.text_to_speech.convert(
-            voice_id=voice_id,
-            text=text,
-            model_id="eleven_multilingual_v2",
-            voice_settings=VoiceSettings(
-                stability=0.5,
-                similarity_boost=0.75,
-                style=0.0,
-                use_speaker_boost=True
-            )
-        )
-        
-        # Save generated audio
-        output_path = "generated_speech.mp3"
-        with open(output_path, 'wb') as f:
-            for chunk in audio_generator:
+        written = 0
+        async with aiofiles.open(part_path, 'wb', buffering=STREAM_BUFFER_SIZE) as f:
+            async for chunk in audio_chunks:
                 if chunk:
-                    f.write(chunk)
+                    await f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+        if not written:
+            raise RuntimeError("ElevenLabs returned no audio")
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    os.replace(part_path, output_path)
+
+
+async def concat_mp3s(paths, output_path):
+    """
+    Concatenate cached MP3s into a single cache file.
+    
+    MP3 frame streams can be joined byte-for-byte, so no re-encoding is needed.
+    
+    Args:
+        paths: MP3 files to join, in order
+        output_path: Cache file returned by tts_cache_path
+    """
+    async def read_all():
+        for path in paths:
+            async with aiofiles.open(path, 'rb') as f:
+                yield await f.read()
+    
+    async for _ in stream_tts_to_cache(output_path, read_all()):
+        pass
+
+
+async def speak_stream(client, voice_id, text, output_path,
+                       model_id, voice_settings=None):
+    """
+    Stream speech for one sentence, reusing the cache when possible.
+    
+    Args:
+        client: AsyncElevenLabs client
+        voice_id: ElevenLabs voice id
+        text: The sentence to convert to speech
+        output_path: Cache file returned by tts_cache_path
+        model_id: ElevenLabs model id
+        voice_settings: Optional VoiceSettings used for generation
+    
+    Yields:
+        bytes or str: MP3 chunks as they arrive, or the cached file path
+    """
+    if use_cached(output_path):
+        yield str(output_path)
+        return
+    
+    kwargs = {"voice_id": voice_id, "text": text, "model_id": model_id}
+    if voice_settings is not None:
+        kwargs["voice_settings"] = voice_settings
+    
+    async with eleven_semaphore():
+        audio_chunks = client.text_to_speech.convert_as_stream(**kwargs)
+        async for chunk in stream_tts_to_cache(output_path, audio_chunks):
+            yield chunk
+
+
+async def synthesize_to_cache(client, voice_id, text, output_path,
+                              model_id, voice_settings=None):
+    """
+    Generate speech for one sentence into the cache without streaming it.
+    
+    Args:
+        client: AsyncElevenLabs client
+        voice_id: ElevenLabs voice id
+        text: The sentence to convert to speech
+        output_path: Cache file returned by tts_cache_path
+        model_id: ElevenLabs model id
+        voice_settings: Optional VoiceSettings used for generation
+    
+    Returns:
+        Path: output_path
+    """
+    chunks = speak_stream(client, voice_id, text, output_path, model_id, voice_settings)
+    async for _ in chunks:
+        pass
+    return output_path
+
+
+async def speak_sentences(client, voice_id, sentences, voice_hash,
+                          model_id, voice_settings=None):
+    """
+    Generate speech for several sentences concurrently, yielding it in order.
+    
+    The first sentence is streamed chunk by chunk while the rest are generated
+    in the background, bounded by the shared ElevenLabs semaphore. Each
+    sentence is cached on its own, so re-running edited text only generates
+    the sentences that changed.
+    
+    Args:
+        client: AsyncElevenLabs client
+        voice_id: ElevenLabs voice id
+        sentences: List of sentences from split_sentences
+        voice_hash: SHA-256 hex digest of the saved voice recording
+        model_id: ElevenLabs model id
+        voice_settings: Optional VoiceSettings used for generation
+    
+    Yields:
+        tuple: (audio_chunk_or_path, sentence_number)
+    """
+    paths = [
+        tts_cache_path(sentence, voice_hash, model_id, voice_settings)
+        for sentence in sentences
+    ]
+    
+    first = speak_stream(client, voice_id, sentences[0], paths[0],
+                         model_id, voice_settings)
+    # Enter the first stream before queueing the rest, so it gets a slot first
+    try:
+        first_audio = await first.__anext__()
+    except StopAsyncIteration:
+        first_audio = None
+    
+    tasks = [
+        asyncio.create_task(synthesize_to_cache(
+            client, voice_id, sentence, path, model_id, voice_settings
+        ))
+        for sentence, path in zip(sentences[1:], paths[1:])
+    ]
+    try:
+        if first_audio is not None:
+            yield first_audio, 1
+            async for chunk in first:
+                yield chunk, 1
         
-        # Step 3: Cleanup - delete the temporary voice to keep account clean
+        for number, task in enumerate(tasks, start=2):
+            yield str(await task), number
+    finally:
+        await first.aclose()
+        for task in tasks:
+            task.cancel()
+        # Retrieve every outcome so failed tasks aren't reported as unhandled
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def prune_tts_cache(max_bytes=TTS_CACHE_MAX_BYTES):
+    """
+    Delete the least recently used cached MP3s until the cache fits max_bytes.
+    
+    Stale part files older than PART_FILE_MAX_AGE are removed in the same pass.
+    
+    Args:
+        max_bytes: Maximum total size of the cache directory
+    """
+    cutoff = time.time() - PART_FILE_MAX_AGE
+    for p in CACHE_DIR.glob("*.part"):
         try:
-            client.voices.delete(voice_id)
-        except Exception:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+        except FileNotFoundError:
             pass
+    
+    entries = []
+    for p in CACHE_DIR.glob("*.mp3"):
+        try:
+            entries.append((p.stat(), p))
+        except FileNotFoundError:
+            continue
+    
+    total = sum(st.st_size for st, _ in entries)
+    for st, p in sorted(entries, key=lambda e: e[0].st_mtime):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        total -= st.st_size
+
+
+def trim_silence(audio_data):
+    """
+    Remove leading and trailing silence from a mono recording.
+    
+    Silence is detected with a moving RMS over SILENCE_WINDOW samples; anything
+    below SILENCE_THRESHOLD of the loudest window at either end is dropped.
+    
+    Args:
+        audio_data: Mono numpy array of samples
+    
+    Returns:
+        numpy.ndarray: The trimmed samples (a view of audio_data)
+    """
+    if audio_data.size == 0:
+        return audio_data
+    
+    samples = audio_data.astype(np.float32)
+    window = np.full(SILENCE_WINDOW, 1.0 / SILENCE_WINDOW, dtype=np.float32)
+    power = oaconvolve(samples * samples, window, mode='same')
+    rms = np.sqrt(np.maximum(power, 0.0))
+    
+    mask = rms > rms.max() * SILENCE_THRESHOLD
+    if not mask.any():
+        return audio_data
+    
+    start = mask.argmax()
+    end = len(mask) - mask[::-1].argmax()
+    return audio_data[start:end]
+
+
+def normalize_peak(audio_data):
+    """
+    Scale a recording so its peak sits at NORMALIZE_PEAK of full scale.
+    
+    Args:
+        audio_data: Numpy array of int16 or float samples
+    
+    Returns:
+        numpy.ndarray: int16 samples
+    """
+    # Work in float so abs(-32768) doesn't wrap for int16 input
+    samples = audio_data.astype(np.float32)
+    peak = np.abs(samples).max() if samples.size else 0.0
+    if peak == 0:
+        return samples.astype(np.int16)
+    
+    samples *= NORMALIZE_PEAK * 32767 / peak
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+def prepare_voice_audio(audio_data, sample_rate):
+    """
+    Clean up a recording before it is saved for cloning.
+    
+    The audio is downmixed to mono, trimmed of leading/trailing silence,
+    resampled to VOICE_SAMPLE_RATE and peak-normalized to int16.
+    
+    Args:
+        audio_data: Numpy array of samples, shaped (frames,) or (frames, channels)
+        sample_rate: Sample rate of audio_data
+    
+    Returns:
+        tuple: (audio_data, sample_rate) with int16 mono samples
+    """
+    if audio_data.ndim == 2:
+        audio_data = audio_data.mean(axis=1)
+    
+    audio_data = trim_silence(audio_data)
+    
+    if sample_rate != VOICE_SAMPLE_RATE:
+        audio_data = resample_poly(audio_data, VOICE_SAMPLE_RATE, sample_rate)
+        sample_rate = VOICE_SAMPLE_RATE
+    
+    return normalize_peak(audio_data), sample_rate
+
+
+def wav_bytes(audio_data, sample_rate):
+    """
+    Encode a recording as an in-memory 16-bit PCM WAV file.
+    
+    The int16 samples from prepare_voice_audio are written as-is with the
+    stdlib wave module, with no further conversion.
+    
+    Args:
+        audio_data: int16 numpy array, shaped (frames,) or (frames, channels)
+        sample_rate: Sample rate of audio_data
+    
+    Returns:
+        bytes: The WAV file contents
+    """
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1 if audio_data.ndim == 1 else audio_data.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(np.ascontiguousarray(audio_data, dtype=np.int16).tobytes())
+    return buf.getvalue()
+
+
+def delete_voice_file(voice):
+    """
+    Remove a session's saved recording once the session ends.
+    
+    Args:
+        voice: Voice saved in the session by save_voice, or None
+    """
+    if voice:
+        Path(voice["path"]).unlink(missing_ok=True)
+
+
+def save_voice(audio_path, clean_up, voice):
+    """
+    Save the recorded audio to the voices directory.
+    
+    Each session gets its own voice file, so concurrent users don't overwrite
+    each other's recordings. The encoded WAV is also kept in the session state
+    so generation can upload it without reading the file back.
+    
+    By default the file Gradio recorded is stored as-is, with no decoding or
+    re-encoding. With clean_up enabled it is decoded and passed through
+    prepare_voice_audio first.
+    
+    Args:
+        audio_path: Path of the WAV file recorded by the Gradio microphone
+        clean_up: Whether to trim silence, normalize and convert to 16 kHz mono
+        voice: Voice previously saved in this session, or None
+    
+    Returns:
+        tuple: (status_message, voice) where voice is a dict with the saved
+            "path", the WAV "data" and its SHA-256 "hash"
+    """
+    if audio_path is None:
+        return "❌ No audio recorded. Please record your voice first.", voice
+    
+    try:
+        # Generate filename, reusing this session's file if it has one
+        if voice:
+            voice_filename = Path(voice["path"])
+        else:
+            voice_filename = VOICES_DIR / f"voice_{uuid.uuid4().hex}.wav"
+        
+        # Save audio file
+        if clean_up:
+            audio_data, sample_rate = sf.read(audio_path, dtype='int16')
+            audio_data, sample_rate = prepare_voice_audio(audio_data, sample_rate)
+            data = wav_bytes(audio_data, sample_rate)
+        else:
+            data = Path(audio_path).read_bytes()
+        voice_filename.write_bytes(data)
         
-        return output_path, "✅ Speech generated using YOUR voice! Listen below."
+        voice = {
+            "path": str(voice_filename),
+            "data": data,
+            "hash": hashlib.sha256(data).hexdigest(),
+        }
+        return f"✅ Voice saved successfully to {voice_filename}!", voice
     
     except Exception as e:
-        error_msg = str(e)
-        if "invalid_api_key" in error_msg.lower() or "unauthorized" in error_msg.lower() or "401" in error_msg:
-            return None, "❌ Invalid API key. Please check your ElevenLabs API key."
-        elif "quota" in error_msg.lower() or "limit" in error_msg.lower():
-            return None, "❌ API quota exceeded. Please check your ElevenLabs account."
-        elif "subscription" in error_msg.lower() or "plan" in error_msg.lower() or "403" in error_msg:
-            return None, "❌ Instant Voice Cloning via API requires a 'Starter' plan or higher. Free users can only use character-based voices in the Dashboard."
-        else:
-            return None, f"❌ Error generating speech: {error_msg}"
+        return f"❌ Error saving voice: {str(e)}", voice
 
 
-def clone_with_voice_design(text, api_key):
+async def clone_and_speak(text, api_key, voice, *, strategy):
     """
-    Alternative method: Uses ElevenLabs Voice Design API for better cloning.
-    This creates a custom voice from the sample.
+    Clone the saved voice and generate speech from text using ElevenLabs API.
     
     Args:
         text: The text to convert to speech
         api_key: ElevenLabs API key
+        voice: Voice saved in this session by save_voice
+        strategy: Key into STRATEGIES selecting the cloning method
     
-    Returns:
-        tuple: (audio_path, status_message)
+    Yields:
+        tuple: (audio_chunk_or_path, status_message)
     """
-    global saved_voice_path
+    cfg = STRATEGIES[strategy]
     
     # Validation
     if not text or text.strip() == "":
-        return None, "❌ Please enter some text to generate speech."
+        yield None, "❌ Please enter some text to generate speech."
+        return
     
     if not api_key or api_key.strip() == "":
-        return None, "❌ Please enter your ElevenLabs API key."
+        yield None, "❌ Please enter your ElevenLabs API key."
+        return
     
-    if saved_voice_path is None or not os.path.exists(saved_voice_path):
-        return None, "❌ No voice saved. Please record and save your voice first."
+    if not voice:
+        yield None, "❌ No voice saved. Please record and save your voice first."
+        return
     
     try:
-        # Initialize ElevenLabs client
-        client = ElevenLabs(api_key=api_key.strip())
+        model_id = cfg["model_id"]
+        voice_settings = cfg["settings"]
         
-        # Add voice from file (Professional Voice Cloning)
-        # Note: This requires a paid plan on ElevenLabs
-        voice = client.voices.add(
-            name="MyClonedVoice",
-            files=[saved_voice_path]
-        )
+        # Reuse previously generated speech for the same text and voice
+        voice_hash = voice["hash"]
+        text = text.strip()
+        output_path = tts_cache_path(text, voice_hash, model_id, voice_settings)
+        if use_cached(output_path):
+            yield str(output_path), "✅ Speech loaded from cache! Listen below."
+            return
         
-        # Generate speech with the cloned voice
-        audio_bytes = client.text_to_speech.convert(
-            voice_id=voice.voice_id,
-            text=text,
-            model_id="eleven_multilingual_v2"
-        )
+        # If every sentence is cached, only the joined file needs rebuilding
+        sentences = split_sentences(text)
+        paths = [
+            tts_cache_path(s, voice_hash, model_id, voice_settings)
+            for s in sentences
+        ]
+        if len(paths) > 1 and all(use_cached(p) for p in paths):
+            try:
+                await concat_mp3s(paths, output_path)
+            except FileNotFoundError:
+                # A sentence was pruned meanwhile; regenerate below instead
+                pass
+            else:
+                yield str(output_path), "✅ Speech loaded from cache! Listen below."
+                return
         
-        # Save generated audio
-        output_path = "generated_speech.mp3"
-        with open(output_path, 'wb') as f:
-            for chunk in audio_bytes:
-                if chunk:
-                    f.write(chunk)
+        # Get the shared ElevenLabs client for this key
+        api_key = api_key.strip()
+        client = get_client(api_key)
+        
+        # Step 1: Clone the recording (reused if it was already uploaded)
+        voice_id = await get_cloned_voice(
+            client,
+            api_key,
+            voice["data"],
+            voice_hash,
+            name=cfg["name"],
+            description=cfg["description"]
+        )
         
-        # Clean up: delete the created voice
         try:
-            client.voices.delete(voice.voice_id)
-        except:
-            pass  # Ignore cleanup errors
+            # Step 2: Generate each sentence concurrently, playing them in order
+            async for audio, number in speak_sentences(
+                client, voice_id, sentences, voice_hash, model_id, voice_settings
+            ):
+                yield audio, f"⏳ Streaming sentence {number}/{len(sentences)}..."
+        finally:
+            release_cloned_voice(voice_hash, api_key)
+        
+        # Keep the full text cached so repeating it is a single file lookup;
+        # if a sentence was pruned meanwhile, the joined entry is just skipped
+        if len(sentences) > 1:
+            try:
+                await concat_mp3s(paths, output_path)
+            except FileNotFoundError:
+                pass
         
-        return output_path, "✅ Speech generated with voice cloning! Listen below."
+        # Evict old cache entries off the event loop, once per request
+        run_in_background(asyncio.to_thread(prune_tts_cache))
+        
+        yield None, cfg["success"]
     
     except Exception as e:
-        error_msg = str(e)
-        if "invalid_api_key" in error_msg.lower() or "unauthorized" in error_msg.lower() or "401" in error_msg:
-            return None, "❌ Invalid API key. Please check your ElevenLabs API key."
-        elif "quota" in error_msg.lower() or "subscription" in error_msg.lower() or "plan" in error_msg.lower():
-            return None, "❌ Voice cloning requires a paid ElevenLabs plan. Try the basic method instead."
-        else:
-            return None, f"❌ Error with voice cloning: {error_msg}"
+        # A voice deleted in the dashboard must be cloned again next time
+        if "voice_not_found" in str(e):
+            forget_cloned_voice(voice["hash"], api_key.strip())
+        yield None, _classify_error(e, cfg["errors"], cfg["error_prefix"])
 
 
 # Create Gradio Interface
@@ -208,9 +987,13 @@ with gr.Blocks(title="Voice Cloning App", theme=gr.themes.Soft()) as app:
             gr.Markdown("### 📝 Step 1 & 2: Record and Save Voice")
             audio_input = gr.Audio(
                 sources=["microphone"],
-                type="numpy",
+                type="filepath",
                 label="Record Your Voice"
             )
+            clean_up_input = gr.Checkbox(
+                label="Clean up recording (trim, normalize, 16 kHz mono)",
+                value=False
+            )
             save_btn = gr.Button("💾 Save Voice", variant="primary")
             save_status = gr.Textbox(label="Status", interactive=False)
         
@@ -233,8 +1016,8 @@ with gr.Blocks(title="Voice Cloning App", theme=gr.themes.Soft()) as app:
     with gr.Row():
         text_input = gr.Textbox(
             label="Text to Speak",
-            placeholder="Type what you want your cloned voice to say...",
-            lines=3
+            placeholder="Type what you want your cloned voice to say... Longer text is split into sentences and generated in parallel.",
+            lines=5
         )
     
     with gr.Row():
@@ -242,28 +1025,48 @@ with gr.Blocks(title="Voice Cloning App", theme=gr.themes.Soft()) as app:
         generate_pro_btn = gr.Button("✨ Generate with Voice Clone (Pro)", variant="secondary", scale=2)
     
     with gr.Row():
-        audio_output = gr.Audio(label="Generated Speech", type="filepath")
+        audio_output = gr.Audio(
+            label="Generated Speech",
+            type="filepath",
+            streaming=True,
+            autoplay=True
+        )
         generation_status = gr.Textbox(label="Generation Status", interactive=False)
     
+    # Per-session saved voice recording (see save_voice)
+    voice_state = gr.State(None, delete_callback=delete_voice_file)
+    
     # Event handlers
     save_btn.click(
         fn=save_voice,
-        inputs=[audio_input],
-        outputs=[save_status]
+        inputs=[audio_input, clean_up_input, voice_state],
+        outputs=[save_status, voice_state]
     )
     
     generate_btn.click(
-        fn=clone_and_speak,
-        inputs=[text_input, api_key_input],
-        outputs=[audio_output, generation_status]
+        fn=functools.partial(clone_and_speak, strategy="basic"),
+        inputs=[text_input, api_key_input, voice_state],
+        outputs=[audio_output, generation_status],
+        api_name="clone_and_speak",
+        concurrency_limit=ELEVEN_CONCURRENCY,
+        concurrency_id="generate",
+        show_progress="minimal"
     )
     
     generate_pro_btn.click(
-        fn=clone_with_voice_design,
-        inputs=[text_input, api_key_input],
-        outputs=[audio_output, generation_status]
+        fn=functools.partial(clone_and_speak, strategy="pro"),
+        inputs=[text_input, api_key_input, voice_state],
+        outputs=[audio_output, generation_status],
+        api_name="clone_with_voice_design",
+        concurrency_limit=ELEVEN_CONCURRENCY,
+        concurrency_id="generate",
+        show_progress="minimal"
     )
 
+# Save Voice uses the queue default; both generate events share the
+# ElevenLabs-sized "generate" limit set above
+app.queue(default_concurrency_limit=UI_CONCURRENCY, max_size=UI_QUEUE_SIZE)
+
 if __name__ == "__main__":
     print("🚀 Starting Voice Cloning Application...")
     print("📂 Voice files will be saved to:", VOICES_DIR.absolute())